@@ -0,0 +1,77 @@
+"""
+Микробенчмарк маршрутизации нажатий на inline-кнопки.
+
+Сравнивает прежнюю схему (цепочка фильтров lambda c: c.data.startswith(...), затем
+split(':') в обработчике) с таблицей CallbackRouter при разном числе действий.
+Запуск: python bench_callbacks.py
+"""
+import sys
+import timeit
+
+from callbacks import CallbackRouter, recipe_id, rating
+
+
+class FakeCallback:
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+
+def handler(callback_query, *values):
+    return values
+
+
+def build_legacy(actions: int) -> list:
+    """Цепочка (фильтр, обработчик), как у @dp.callback_query(lambda ...) в прежнем bot.py"""
+    chain = []
+    for i in range(actions):
+        prefix = f'action{i}:'
+        chain.append((lambda c, prefix=prefix: c.data and c.data.startswith(prefix),
+                      lambda c: handler(c, *c.data.split(':')[1:])))
+    return chain
+
+
+def legacy_dispatch(chain: list, callback_query):
+    for check, func in chain:
+        if check(callback_query):
+            return func(callback_query)
+    return None
+
+
+def build_router(actions: int) -> CallbackRouter:
+    router = CallbackRouter()
+    for i in range(actions):
+        router.action(f'a{i}', recipe_id, rating)(handler)
+    return router
+
+
+def router_dispatch(router: CallbackRouter, callback_query):
+    parsed = router.parse(callback_query.data)
+    if parsed is None:
+        return None
+    func, values = parsed
+    return func(callback_query, *values)
+
+
+def main() -> None:
+    number = 200000
+    for actions in (5, 50, 500):
+        chain = build_legacy(actions)
+        router = build_router(actions)
+        last = actions - 1
+        cases = [
+            ('первое действие', FakeCallback('action0:52771:5'), FakeCallback('a0:52771:5')),
+            ('последнее действие', FakeCallback(f'action{last}:52771:5'), FakeCallback(f'a{last}:52771:5')),
+            ('неизвестная кнопка', FakeCallback('stale:52771'), FakeCallback('stale:52771')),
+        ]
+        print(f"Действий: {actions}")
+        for name, legacy_query, router_query in cases:
+            legacy = timeit.timeit(lambda: legacy_dispatch(chain, legacy_query), number=number) / number
+            table = timeit.timeit(lambda: router_dispatch(router, router_query), number=number) / number
+            print(f"  {name}: цепочка фильтров {legacy * 1e9:.0f} нс, таблица {table * 1e9:.0f} нс "
+                  f"(x{legacy / table:.1f})")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
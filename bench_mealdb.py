@@ -0,0 +1,84 @@
+"""
+Микробенчмарк разбора ответов TheMealDB: скорость декодирования и память на рецепт в кэше.
+
+Сравнивает прежний способ (json.loads и полные словари meal) с компактной записью Meal
+(orjson, если установлен). Запуск: python bench_mealdb.py
+"""
+import json
+import sys
+import timeit
+import tracemalloc
+
+from meal import Meal, parse_meals, loads
+
+
+def make_meal(i: int) -> dict:
+    """Рецепт в формате TheMealDB: около 50 полей, из них 20 пар ингредиентов"""
+    meal = {
+        'idMeal': str(52770 + i),
+        'strMeal': f'Spaghetti Bolognese {i}',
+        'strDrinkAlternate': None,
+        'strCategory': 'Beef',
+        'strArea': 'Italian',
+        'strInstructions': 'Put the onion and oil in a large pan and fry over a fairly high heat. ' * 20,
+        'strMealThumb': f'https://www.themealdb.com/images/media/meals/{i}.jpg',
+        'strTags': 'Pasta,Meat',
+        'strYoutube': 'https://www.youtube.com/watch?v=-gF8d-fitkU',
+        'strSource': None,
+        'strImageSource': None,
+        'strCreativeCommonsConfirmed': None,
+        'dateModified': None,
+    }
+    for n in range(1, 21):
+        meal[f'strIngredient{n}'] = f'Ingredient {n}' if n <= 10 else ''
+        meal[f'strMeasure{n}'] = f'{n} tbs' if n <= 10 else ' '
+    return meal
+
+
+def legacy_parse(body: bytes) -> list:
+    """Прежний разбор search_mealdb: полный словарь в кэше и копия полей для списка"""
+    data = json.loads(body)
+    recipes = []
+    for meal in data.get('meals') or []:
+        recipes.append({
+            'id': meal['idMeal'],
+            'title': meal['strMeal'],
+            'desc': meal.get('strInstructions', '')[:300] + '...',
+            'img': meal.get('strMealThumb', '')
+        })
+    return [data['meals'], recipes]
+
+
+def measure_memory(build, count: int) -> float:
+    """Байт на один закэшированный рецепт"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    cache = build(count)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del cache
+    return size / count
+
+
+def main() -> None:
+    body = json.dumps({'meals': [make_meal(i) for i in range(25)]}).encode('utf-8')
+    decoder = 'orjson' if loads is not json.loads else 'json'
+    print(f"Ответ search.php: 25 рецептов, {len(body)} байт; декодер Meal: {decoder}")
+
+    number = 2000
+    legacy = timeit.timeit(lambda: legacy_parse(body), number=number) / number
+    compact = timeit.timeit(lambda: parse_meals(body), number=number) / number
+    print(f"Разбор ответа: прежний {legacy * 1e6:.0f} мкс, Meal {compact * 1e6:.0f} мкс "
+          f"(x{legacy / compact:.1f})")
+
+    count = 1000
+    raw = [json.dumps(make_meal(i)).encode('utf-8') for i in range(count)]
+    legacy_size = measure_memory(lambda n: [json.loads(raw[i]) for i in range(n)], count)
+    compact_size = measure_memory(lambda n: [Meal.from_json(loads(raw[i])) for i in range(n)], count)
+    print(f"Память на рецепт в кэше: словарь {legacy_size:.0f} байт, Meal {compact_size:.0f} байт "
+          f"(x{legacy_size / compact_size:.1f})")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
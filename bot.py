@@ -1,19 +1,95 @@
 import logging
-from aiogram import Bot, Dispatcher, types
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto
+import time
+from aiogram import Bot, Dispatcher, types, BaseMiddleware
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto, InlineQueryResultPhoto
 from config import BOT_TOKEN
 import asyncio
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 import aiohttp
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
+from profiling import Profiler
+from recipe_cache import TTLCache, RecipeIndex, DebouncedLookup
+from prefetch import Prefetcher
+from snapshot import Snapshotter, LazyDict, MemoryStorageSnapshot
+from dedupe import Deduplicator
+from meal import parse_meals
+from broadcast import Broadcaster
+from callbacks import CallbackRouter, recipe_id as recipe_id_field, rating as rating_field
+
+try:
+    from config import ADMIN_IDS
+except ImportError:
+    ADMIN_IDS = []
+
+try:
+    from config import PROFILE_DIR
+except ImportError:
+    PROFILE_DIR = 'profiles'
+
+try:
+    from config import PREFETCH_CHAT_ID
+except ImportError:
+    PREFETCH_CHAT_ID = None
+
+try:
+    from config import SNAPSHOT_PATH
+except ImportError:
+    SNAPSHOT_PATH = 'bot_state.snap'
+
+try:
+    from config import BROADCAST_STATE
+except ImportError:
+    BROADCAST_STATE = 'bot_broadcast.json'
 
 logging.basicConfig(level=logging.INFO)
 
 bot = Bot(token=BOT_TOKEN)
 dp = Dispatcher()
 
+# Профилировщик по требованию (/profile, SIGUSR1/SIGUSR2), выключен по умолчанию
+profiler = Profiler(output_dir=PROFILE_DIR)
+
+# --- Защита от повторной обработки ---
+# Повторно доставленные обновления (ретраи вебхука, перезапуск polling)
+update_dedupe = Deduplicator(window=600)
+# Двойные нажатия на одну и ту же кнопку
+callback_dedupe = Deduplicator(window=3)
+
+class DedupeMiddleware(BaseMiddleware):
+    def __init__(self, dedupe, key):
+        self.dedupe = dedupe
+        self.key = key
+
+    async def __call__(self, handler, event, data):
+        key = self.key(event)
+        duplicate = key in self.dedupe
+        # Повтор не выполняет обработчик заново, а дожидается результата оригинала
+        result = await self.dedupe.run(key, handler, event, data)
+        if duplicate and isinstance(event, types.CallbackQuery):
+            await event.answer()
+        return result
+
+dp.update.outer_middleware(DedupeMiddleware(update_dedupe, lambda update: update.update_id))
+dp.callback_query.outer_middleware(DedupeMiddleware(callback_dedupe, lambda c: (c.from_user.id, c.data)))
+
+# --- Рассылка ---
+# Чаты, с которыми общался бот (chat_id -> время последнего обновления), — получатели /broadcast
+seen_chats = LazyDict()
+broadcaster = Broadcaster(BROADCAST_STATE, permanent_errors=(TelegramForbiddenError, TelegramBadRequest))
+
+@dp.update.outer_middleware()
+async def remember_chat(handler, event, data):
+    chat = data.get('event_chat')
+    if chat is not None:
+        seen_chats[chat.id] = int(time.time())
+    return await handler(event, data)
+
 # --- Кнопки ---
+# Все нажатия на inline-кнопки разбираются один раз и маршрутизируются по коду действия
+callback_router = CallbackRouter()
+
 main_menu = ReplyKeyboardMarkup(
     keyboard=[
         [KeyboardButton(text='Поиск рецептов')],
@@ -23,13 +99,31 @@ main_menu = ReplyKeyboardMarkup(
 )
 
 # --- Простая in-memory база избранных рецептов ---
-favorites_db = {}
+favorites_db = LazyDict()
+
+# --- Кэш поиска и локальный индекс рецептов ---
+search_cache = TTLCache(maxsize=512, ttl=3600)
+recipe_index = RecipeIndex()
+# Полные рецепты (lookup.php) и file_id уже загруженных в Telegram картинок
+meal_cache = TTLCache(maxsize=1024, ttl=6 * 3600)
+thumb_file_ids = TTLCache(maxsize=4096, ttl=7 * 24 * 3600)
+
+# Сколько первых результатов поиска прогревать в фоне
+PREFETCH_TOP_N = 3
+
+# Inline-режим: пауза перед запросом к TheMealDB и предельное время ожидания ответа,
+# чтобы уложиться в срок ответа на inline-запрос даже при медленном API
+INLINE_DEBOUNCE = 0.3
+INLINE_TIMEOUT = 1.5
+# Сколько секунд Telegram может кэшировать ответ на inline-запрос
+INLINE_CACHE_TIME = 300
+INLINE_PARTIAL_CACHE_TIME = 5
 
 def get_recipe_inline(recipe_id):
     buttons = [
         [
-            InlineKeyboardButton(text='Добавить в избранное', callback_data=f'favadd:{recipe_id}'),
-            InlineKeyboardButton(text='Показать рецепт', callback_data=f'show:{recipe_id}')
+            InlineKeyboardButton(text='Добавить в избранное', callback_data=callback_router.pack('f', recipe_id)),
+            InlineKeyboardButton(text='Показать рецепт', callback_data=callback_router.pack('s', recipe_id))
         ]
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
@@ -38,19 +132,16 @@ def get_recipe_list_markup(recipes):
     buttons = []
     for recipe in recipes:
         buttons.append([
-            InlineKeyboardButton(text=recipe['title'], callback_data=f'show:{recipe['id']}'),
-            InlineKeyboardButton(text='❤️', callback_data=f'favadd:{recipe['id']}')
+            InlineKeyboardButton(text=recipe.title, callback_data=callback_router.pack('s', recipe.id)),
+            InlineKeyboardButton(text='❤️', callback_data=callback_router.pack('f', recipe.id))
         ])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 # --- Рейтинг ---
 def get_rating_markup(recipe_id):
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text='⭐️', callback_data=f'rate:{recipe_id}:1'),
-         InlineKeyboardButton(text='⭐️⭐️', callback_data=f'rate:{recipe_id}:2'),
-         InlineKeyboardButton(text='⭐️⭐️⭐️', callback_data=f'rate:{recipe_id}:3'),
-         InlineKeyboardButton(text='⭐️⭐️⭐️⭐️', callback_data=f'rate:{recipe_id}:4'),
-         InlineKeyboardButton(text='⭐️⭐️⭐️⭐️⭐️', callback_data=f'rate:{recipe_id}:5')]
+        [InlineKeyboardButton(text='⭐️' * rating, callback_data=callback_router.pack('r', recipe_id, rating))
+         for rating in range(1, 6)]
     ])
 
 # --- Состояния ---
@@ -66,6 +157,30 @@ async def send_welcome(message: types.Message, state: FSMContext):
         reply_markup=main_menu
     )
 
+@dp.message(Command('profile'))
+async def profile_command(message: types.Message, command: CommandObject):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    await message.answer(profiler.handle_command(command.args or ''))
+
+@dp.message(Command('stats'))
+async def stats_command(message: types.Message):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    await message.answer(
+        f"{prefetcher.summary()}\n\n{snapshotter.summary()}\n\n"
+        f"{update_dedupe.summary('Обновления')}\n{callback_dedupe.summary('Нажатия кнопок')}\n\n"
+        f"{callback_router.summary()}\n\n{broadcaster.summary()}"
+    )
+
+@dp.message(Command('broadcast'))
+async def broadcast_command(message: types.Message, command: CommandObject):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    # Пользователи из избранного могли писать боту до появления seen_chats
+    recipients = set(seen_chats) | set(favorites_db)
+    await message.answer(broadcaster.handle_command(command.args or '', recipients, bot.send_message))
+
 @dp.message(lambda message: message.text == 'Поиск рецептов')
 async def search_recipes(message: types.Message, state: FSMContext):
     await message.answer("Введите название блюда или ингредиент для поиска рецепта:")
@@ -76,11 +191,14 @@ async def handle_search_query(message: types.Message, state: FSMContext):
     query = message.text.strip()
     await message.answer('Ищу рецепты...')
     recipes = await search_mealdb(query)
-    if not recipes:
+    if recipes is None:
+        await message.answer('Сервис рецептов временно недоступен. Попробуйте позже.')
+    elif not recipes:
         await message.answer('Ничего не найдено. Попробуйте другой запрос.')
     else:
         markup = get_recipe_list_markup(recipes)
         await message.answer('Найденные рецепты:', reply_markup=markup)
+        prefetcher.schedule([recipe.id for recipe in recipes])
     await state.clear()
 
 @dp.message(lambda message: message.text == 'Мои рецепты')
@@ -93,6 +211,8 @@ async def my_recipes(message: types.Message, state: FSMContext):
     else:
         markup = get_favorites_list_markup(favs)
         await message.answer('Ваши избранные рецепты:', reply_markup=markup)
+        favs_sorted = sorted(favs, key=lambda r: (-r.get('rating', 0), r['title']))
+        prefetcher.schedule([recipe['id'] for recipe in favs_sorted])
 
 # --- Пример структуры для отображения рецепта ---
 async def show_recipe(chat_id, recipe, show_full=False):
@@ -102,65 +222,54 @@ async def show_recipe(chat_id, recipe, show_full=False):
     markup = get_recipe_inline(recipe['id'])
     await bot.send_photo(chat_id, recipe.get('img', ''), caption=text, parse_mode='HTML', reply_markup=markup)
 
-# --- Обработка нажатия на кнопку 'В избранное' ---
-@dp.callback_query(lambda c: c.data and c.data.startswith('favorite:'))
-async def process_favorite(callback_query: types.CallbackQuery):
-    recipe_id = callback_query.data.split(':')[1]
-    # Здесь будет логика добавления/удаления из избранного
-    await callback_query.answer('Рецепт добавлен в избранное (заглушка)')
+# --- Единая точка входа для inline-кнопок: таблица действий callback_router ---
+@dp.callback_query()
+async def route_callback(callback_query: types.CallbackQuery):
+    await callback_router.dispatch(callback_query)
+
+# --- Общий путь кнопок рецепта: загрузка через кэш, ответ, если рецепт не найден ---
+async def load_meal(callback_query, recipe_id):
+    meal = await fetch_meal(recipe_id)
+    if meal is None:
+        await callback_query.answer('Рецепт не найден!')
+    return meal
+
+async def send_full_recipe(callback_query, recipe_id, markup=None):
+    prefetcher.record_access(recipe_id)
+    meal = await load_meal(callback_query, recipe_id)
+    if meal:
+        await send_recipe_photo(callback_query.message, recipe_id, meal, meal.caption(), markup)
+        # Предложить поставить рейтинг
+        await callback_query.message.answer('Поставьте рейтинг этому рецепту:', reply_markup=get_rating_markup(recipe_id))
+        await callback_query.answer()
 
 # --- Изменить добавление в избранное: рейтинг по умолчанию 0 ---
-@dp.callback_query(lambda c: c.data and c.data.startswith('favadd:'))
-async def add_to_favorites(callback_query: types.CallbackQuery):
-    recipe_id = callback_query.data.split(':')[1]
+@callback_router.action('f', recipe_id_field, aliases=('favadd',))
+async def add_to_favorites(callback_query: types.CallbackQuery, recipe_id: str):
     user_id = callback_query.from_user.id
-    url = f'https://www.themealdb.com/api/json/v1/1/lookup.php?i={recipe_id}'
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
-            data = await resp.json()
-            meal = data['meals'][0] if data['meals'] else None
-            if not meal:
-                await callback_query.answer('Рецепт не найден!')
-                return
-            title = meal['strMeal']
-            img = meal.get('strMealThumb', '')
-            if user_id not in favorites_db:
-                favorites_db[user_id] = []
-            if not any(r['id'] == recipe_id for r in favorites_db[user_id]):
-                favorites_db[user_id].append({'id': recipe_id, 'title': title, 'img': img, 'rating': 0})
-                await callback_query.answer('Добавлено в избранное!')
-            else:
-                await callback_query.answer('Уже в избранном!')
+    meal = await load_meal(callback_query, recipe_id)
+    if not meal:
+        return
+    title = meal.title
+    img = meal.thumb
+    if user_id not in favorites_db:
+        favorites_db[user_id] = []
+    if not any(r['id'] == recipe_id for r in favorites_db[user_id]):
+        favorites_db[user_id].append({'id': recipe_id, 'title': title, 'img': img, 'rating': 0})
+        await callback_query.answer('Добавлено в избранное!')
+    else:
+        await callback_query.answer('Уже в избранном!')
 
 # --- После показа рецепта предлагать поставить рейтинг ---
-@dp.callback_query(lambda c: c.data and c.data.startswith('show:'))
-async def show_full_recipe(callback_query: types.CallbackQuery):
-    recipe_id = callback_query.data.split(':')[1]
-    url = f'https://www.themealdb.com/api/json/v1/1/lookup.php?i={recipe_id}'
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
-            data = await resp.json()
-            meal = data['meals'][0] if data['meals'] else None
-            if meal:
-                desc = meal.get('strInstructions', '')
-                img = meal.get('strMealThumb', '')
-                text = f"<b>{meal['strMeal']}</b>\n{desc}"
-                if len(text) > 1000:
-                    text = text[:997] + '...'
-                markup = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text='Добавить в избранное', callback_data=f'favadd:{recipe_id}')]])
-                await callback_query.message.answer_photo(img, caption=text, parse_mode='HTML', reply_markup=markup)
-                # Предложить поставить рейтинг
-                await callback_query.message.answer('Поставьте рейтинг этому рецепту:', reply_markup=get_rating_markup(recipe_id))
-            else:
-                await callback_query.answer('Рецепт не найден!')
-    await callback_query.answer()
+@callback_router.action('s', recipe_id_field, aliases=('show',))
+async def show_full_recipe(callback_query: types.CallbackQuery, recipe_id: str):
+    markup = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text='Добавить в избранное', callback_data=callback_router.pack('f', recipe_id))]])
+    await send_full_recipe(callback_query, recipe_id, markup)
 
 # --- Обработка выставления рейтинга ---
-@dp.callback_query(lambda c: c.data and c.data.startswith('rate:'))
-async def rate_recipe(callback_query: types.CallbackQuery):
-    _, recipe_id, rating = callback_query.data.split(':')
+@callback_router.action('r', recipe_id_field, rating_field, aliases=('rate',))
+async def rate_recipe(callback_query: types.CallbackQuery, recipe_id: str, rating: int):
     user_id = callback_query.from_user.id
-    rating = int(rating)
     favs = favorites_db.get(user_id, [])
     for recipe in favs:
         if recipe['id'] == recipe_id:
@@ -175,53 +284,132 @@ def get_favorites_list_markup(favs):
     # Сортируем по убыванию рейтинга, потом по названию
     favs_sorted = sorted(favs, key=lambda r: (-r.get('rating', 0), r['title']))
     buttons = [
-        [InlineKeyboardButton(text=f"{recipe['title']} {'⭐️'*recipe.get('rating', 0)}", callback_data=f'showfav:{recipe['id']}')] for recipe in favs_sorted
+        [InlineKeyboardButton(text=f"{recipe['title']} {'⭐️'*recipe.get('rating', 0)}", callback_data=callback_router.pack('v', recipe['id']))] for recipe in favs_sorted
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 # --- В showfav также предлагать поставить рейтинг ---
-@dp.callback_query(lambda c: c.data and c.data.startswith('showfav:'))
-async def show_favorite_recipe(callback_query: types.CallbackQuery):
-    recipe_id = callback_query.data.split(':')[1]
-    url = f'https://www.themealdb.com/api/json/v1/1/lookup.php?i={recipe_id}'
+@callback_router.action('v', recipe_id_field, aliases=('showfav',))
+async def show_favorite_recipe(callback_query: types.CallbackQuery, recipe_id: str):
+    await send_full_recipe(callback_query, recipe_id)
+
+# --- Общая загрузка рецепта по id (lookup.php) через кэш ---
+async def fetch_meal(recipe_id):
+    meal = meal_cache.get(recipe_id)
+    if meal is not None:
+        return meal
+    url = 'https://www.themealdb.com/api/json/v1/1/lookup.php'
     async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
-            data = await resp.json()
-            meal = data['meals'][0] if data['meals'] else None
-            if meal:
-                desc = meal.get('strInstructions', '')
-                img = meal.get('strMealThumb', '')
-                text = f"<b>{meal['strMeal']}</b>\n{desc}"
-                if len(text) > 1000:
-                    text = text[:997] + '...'
-                await callback_query.message.answer_photo(img, caption=text, parse_mode='HTML')
-                await callback_query.message.answer('Поставьте рейтинг этому рецепту:', reply_markup=get_rating_markup(recipe_id))
-            else:
-                await callback_query.answer('Рецепт не найден!')
-    await callback_query.answer()
+        async with session.get(url, params={'i': recipe_id}) as resp:
+            meals = parse_meals(await resp.read())
+    meal = meals[0] if meals else None
+    if meal:
+        meal_cache.set(recipe_id, meal)
+    return meal
+
+# --- Отправка фото рецепта: повторно используем file_id, если Telegram уже видел картинку ---
+async def send_recipe_photo(message, recipe_id, meal, text, markup=None):
+    photo = thumb_file_ids.get(recipe_id) or meal.thumb
+    sent = await message.answer_photo(photo, caption=text, parse_mode='HTML', reply_markup=markup)
+    thumb_file_ids.set(recipe_id, sent.photo[-1].file_id)
+
+# --- Предзагрузка рецептов, которые скорее всего откроют следующими ---
+def needs_prefetch(recipe_id):
+    if recipe_id not in meal_cache:
+        return True
+    return bool(PREFETCH_CHAT_ID) and recipe_id not in thumb_file_ids
+
+async def prefetch_recipe(recipe_id):
+    # Возвращает True, только если действительно что-то загрузили
+    warmed = recipe_id not in meal_cache
+    meal = await fetch_meal(recipe_id)
+    if meal and PREFETCH_CHAT_ID and recipe_id not in thumb_file_ids:
+        # Загружаем картинку в служебный чат, чтобы получить file_id заранее
+        sent = await bot.send_photo(PREFETCH_CHAT_ID, meal.thumb, disable_notification=True)
+        thumb_file_ids.set(recipe_id, sent.photo[-1].file_id)
+        warmed = True
+    return warmed and meal is not None
+
+prefetcher = Prefetcher(prefetch_recipe, top_n=PREFETCH_TOP_N, concurrency=2, needed=needs_prefetch)
 
 async def search_mealdb(query):
-    url = f'https://www.themealdb.com/api/json/v1/1/search.php?s={query}'
+    key = query.strip().lower()
+    cached = search_cache.get(key)
+    if cached is not None:
+        return cached
+    url = 'https://www.themealdb.com/api/json/v1/1/search.php'
     async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
+        async with session.get(url, params={'s': key}) as resp:
             if resp.status != 200:
-                return []
-            data = await resp.json()
-            meals = data.get('meals')
-            if not meals:
-                return []
-            recipes = []
-            for meal in meals:
-                recipes.append({
-                    'id': meal['idMeal'],
-                    'title': meal['strMeal'],
-                    'desc': meal.get('strInstructions', '')[:300] + '...',
-                    'img': meal.get('strMealThumb', '')
-                })
-            return recipes
+                # None — ошибка API, а не пустой результат: такой ответ нельзя кэшировать
+                logging.warning(f"TheMealDB search.php вернул {resp.status} для '{key}'")
+                return None
+            recipes = parse_meals(await resp.read())
+    # search.php возвращает рецепт целиком — сразу кладем его в кэш lookup
+    for meal in recipes:
+        meal_cache.set(meal.id, meal)
+    search_cache.set(key, recipes)
+    recipe_index.add(recipes)
+    return recipes
+
+inline_lookup = DebouncedLookup(search_mealdb, delay=INLINE_DEBOUNCE)
+
+# --- Inline-режим: @bot запрос ---
+def get_inline_results(recipes):
+    results = []
+    for recipe in recipes[:50]:
+        results.append(InlineQueryResultPhoto(
+            id=recipe.id,
+            photo_url=recipe.thumb,
+            thumbnail_url=f"{recipe.thumb}/preview",
+            title=recipe.title,
+            caption=recipe.caption(),
+            parse_mode='HTML'
+        ))
+    return results
+
+@dp.inline_query()
+async def inline_search(inline_query: types.InlineQuery):
+    query = inline_query.query.strip().lower()
+    if not query:
+        await inline_query.answer([], cache_time=INLINE_CACHE_TIME)
+        return
+    recipes = search_cache.get(query)
+    if recipes is not None:
+        await inline_query.answer(get_inline_results(recipes), cache_time=INLINE_CACHE_TIME)
+        return
+    recipes = await inline_lookup.lookup(inline_query.from_user.id, query, timeout=INLINE_TIMEOUT)
+    if recipes is None:
+        # Запрос устарел, TheMealDB не успел ответить или вернул ошибку — отдаем то, что есть локально,
+        # и не даем Telegram надолго кэшировать неполный ответ
+        await inline_query.answer(get_inline_results(recipe_index.search(query)),
+                                  cache_time=INLINE_PARTIAL_CACHE_TIME)
+    else:
+        await inline_query.answer(get_inline_results(recipes), cache_time=INLINE_CACHE_TIME)
+
+# --- Снимки состояния для теплого перезапуска ---
+snapshotter = Snapshotter(SNAPSHOT_PATH, interval=300)
+snapshotter.register('favorites', favorites_db)
+snapshotter.register('fsm', MemoryStorageSnapshot(dp.storage))
+snapshotter.register('searches', search_cache)
+snapshotter.register('meals', meal_cache)
+snapshotter.register('thumb_file_ids', thumb_file_ids)
+snapshotter.register('meal_index', recipe_index)
+snapshotter.register('chats', seen_chats)
 
 async def main():
-    await dp.start_polling(bot)
+    profiler.install_signal_handlers()
+    snapshotter.restore()
+    broadcaster.resume(bot.send_message)
+    periodic = asyncio.create_task(snapshotter.run_periodic())
+    try:
+        await dp.start_polling(bot)
+    finally:
+        periodic.cancel()
+        broadcaster.stop()
+        # Дожидаемся остановки периодической задачи; идущее сохранение завершится до финального
+        await asyncio.gather(periodic, return_exceptions=True)
+        await snapshotter.save()
 
 if __name__ == '__main__':
     asyncio.run(main())
@@ -0,0 +1,285 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram: около 30 сообщений в секунду на бота и 1 в секунду в один чат.
+# Рассылка берет меньше глобального лимита, чтобы оставить запас для обычных ответов.
+GLOBAL_RATE = 20
+PER_CHAT_RATE = 1
+MAX_MESSAGE_LENGTH = 4096
+
+
+def write_json_atomic(path: str, data) -> None:
+    """Записывает JSON во временный файл и атомарно заменяет им path"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class TokenBucket:
+    """Token bucket: в среднем rate разрешений в секунду, всплеск до capacity"""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Запрещает выдачу разрешений на seconds секунд (после retry_after от Telegram)"""
+        self._tokens = -seconds * self.rate
+        self._updated = time.monotonic()
+
+
+class ChatRegistry:
+    """Список чатов, с которыми бот уже общался; периодически сохраняется в JSON"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._chats = {}
+        self._dirty = False
+        if os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self._chats = {int(chat_id): seen for chat_id, seen in json.load(f).items()}
+            except (OSError, ValueError) as e:
+                logger.warning(f"Не удалось прочитать {path}: {e}")
+
+    def add(self, chat_id: int) -> None:
+        if chat_id not in self._chats:
+            self._dirty = True
+        self._chats[chat_id] = int(time.time())
+
+    def __iter__(self):
+        return iter(list(self._chats))
+
+    def __len__(self) -> int:
+        return len(self._chats)
+
+    def save(self) -> None:
+        if self._dirty:
+            write_json_atomic(self.path, self._chats)
+            self._dirty = False
+
+    async def run_periodic(self, interval: float = 60) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.save()
+            except OSError as e:
+                logger.error(f"Не удалось сохранить {self.path}: {e}")
+
+
+class Broadcaster:
+    """
+    Рассылка сообщений всем получателям без превышения лимитов Telegram.
+
+    Список получателей и текст сохраняются в state_path при запуске, а позиция
+    (курсор) — после каждого отправленного сообщения, поэтому после падения рассылка
+    продолжается с того же места. Отправка идет в фоне несколькими параллельными
+    отправителями, общий темп ограничен глобальным token bucket, а каждый чат —
+    своим, так что обычные обработчики не простаивают.
+    """
+
+    def __init__(self, state_path: str, permanent_errors=(), global_rate: float = GLOBAL_RATE,
+                 per_chat_rate: float = PER_CHAT_RATE, max_attempts: int = 3):
+        """
+        Args:
+            state_path (str): Файл состояния рассылки
+            permanent_errors: Исключения, после которых получатель пропускается (бот заблокирован и т.п.)
+            global_rate (float): Сообщений в секунду на всю рассылку
+            per_chat_rate (float): Сообщений в секунду в один чат
+            max_attempts (int): Попыток отправки при прочих ошибках
+        """
+        self.state_path = state_path
+        self.cursor_path = state_path + '.cursor'
+        self.permanent_errors = tuple(permanent_errors)
+        self.per_chat_rate = per_chat_rate
+        # Столько чатов обслуживается одновременно, чтобы поканальный лимит не сдерживал общий темп
+        self.concurrency = max(1, math.ceil(global_rate / per_chat_rate))
+        self.max_attempts = max_attempts
+        self._global = TokenBucket(global_rate)
+        self._task = None
+        self._state = None
+        self._progress = None
+        self._started_at = 0.0
+        self._sent_at_start = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, text: str, recipients, send) -> int:
+        """
+        Запускает новую рассылку
+
+        Args:
+            text (str): Текст сообщения
+            recipients: ID чатов получателей
+            send: Корутинная функция send(chat_id, text)
+
+        Returns:
+            int: Число получателей
+        """
+        if self.running:
+            raise RuntimeError("Рассылка уже идет")
+        self._state = {
+            'text': text,
+            'recipients': sorted(set(recipients)),
+            'created_at': time.time(),
+        }
+        write_json_atomic(self.state_path, self._state)
+        self._save_cursor({'cursor': 0, 'done': [], 'sent': 0, 'failed': 0})
+        self._launch(send)
+        return len(self._state['recipients'])
+
+    def resume(self, send) -> bool:
+        """Продолжает незавершенную рассылку после перезапуска; возвращает True, если она была"""
+        if self.running or not os.path.exists(self.state_path):
+            return False
+        with open(self.state_path, encoding='utf-8') as f:
+            state = json.load(f)
+        progress = self._load_cursor()
+        if progress['cursor'] >= len(state['recipients']):
+            return False
+        logger.info(f"Продолжаем рассылку с позиции {progress['cursor']} из {len(state['recipients'])}")
+        self._state = state
+        self._launch(send)
+        return True
+
+    def stop(self) -> None:
+        """Останавливает рассылку; ее можно продолжить через resume"""
+        if self.running:
+            self._task.cancel()
+
+    def _launch(self, send) -> None:
+        self._progress = self._load_cursor()
+        self._started_at = time.monotonic()
+        self._sent_at_start = self._progress['sent']
+        self._task = asyncio.create_task(self._run(send))
+
+    def _load_cursor(self) -> dict:
+        try:
+            with open(self.cursor_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'cursor': 0, 'done': [], 'sent': 0, 'failed': 0}
+
+    def _save_cursor(self, progress: dict) -> None:
+        write_json_atomic(self.cursor_path, progress)
+
+    @staticmethod
+    def _split(text: str) -> list:
+        return [text[i:i + MAX_MESSAGE_LENGTH] for i in range(0, len(text), MAX_MESSAGE_LENGTH)] or ['']
+
+    async def _send_one(self, send, chat_id: int, parts: list) -> bool:
+        chat_bucket = TokenBucket(self.per_chat_rate)
+        for part in parts:
+            attempt = 0
+            while True:
+                # Сначала ждем свой чат, чтобы не занимать глобальный лимит впустую
+                await chat_bucket.acquire()
+                await self._global.acquire()
+                try:
+                    await send(chat_id, part)
+                    break
+                except self.permanent_errors as e:
+                    logger.info(f"Рассылка: чат {chat_id} пропущен: {e}")
+                    return False
+                except Exception as e:
+                    retry_after = getattr(e, 'retry_after', None)
+                    if retry_after is not None:
+                        # Telegram просит подождать — останавливаем всю рассылку, а не только этот чат
+                        seconds = getattr(retry_after, 'total_seconds', lambda: retry_after)()
+                        logger.warning(f"Рассылка: flood control, пауза {seconds} с")
+                        self._global.pause(seconds)
+                        continue
+                    attempt += 1
+                    if attempt >= self.max_attempts:
+                        logger.warning(f"Рассылка: не удалось отправить в чат {chat_id}: {e}")
+                        return False
+                    await asyncio.sleep(2 ** attempt)
+        return True
+
+    async def _run(self, send) -> None:
+        recipients = self._state['recipients']
+        parts = self._split(self._state['text'])
+        progress = self._progress
+        # cursor — все получатели до него обработаны, done — обработанные после него не по порядку
+        done = set(progress['done'])
+        pending = (i for i in range(progress['cursor'], len(recipients)) if i not in done)
+
+        async def worker():
+            for index in pending:
+                if await self._send_one(send, recipients[index], parts):
+                    progress['sent'] += 1
+                else:
+                    progress['failed'] += 1
+                done.add(index)
+                while progress['cursor'] in done:
+                    done.remove(progress['cursor'])
+                    progress['cursor'] += 1
+                progress['done'] = sorted(done)
+                self._save_cursor(progress)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        logger.info(f"Рассылка завершена: отправлено {progress['sent']}, ошибок {progress['failed']}")
+
+    def summary(self) -> str:
+        """Прогресс, скорость и оценка оставшегося времени"""
+        if self._state is None or self._progress is None:
+            return "Рассылок не было"
+        progress = self._progress
+        total = len(self._state['recipients'])
+        done = progress['sent'] + progress['failed']
+        elapsed = time.monotonic() - self._started_at
+        rate = (progress['sent'] - self._sent_at_start) / elapsed if elapsed else 0.0
+        status = "идет" if self.running else ("завершена" if done >= total else "остановлена")
+        eta = f", осталось ~{(total - done) / rate:.0f} с" if self.running and rate else ""
+        return (f"Рассылка {status}: {done}/{total}, отправлено {progress['sent']}, ошибок {progress['failed']}, "
+                f"{rate:.1f} сообщ./с{eta}")
+
+    def handle_command(self, arg: str, recipients, send) -> str:
+        """
+        Выполняет команду администратора /broadcast
+
+        Args:
+            arg (str): Текст рассылки, stop, resume или пустая строка для статуса
+            recipients: Получатели новой рассылки
+            send: Корутинная функция send(chat_id, text)
+
+        Returns:
+            str: Текст ответа
+        """
+        arg = arg.strip()
+        if not arg:
+            return self.summary() + "\n\nИспользование: /broadcast текст | stop | resume"
+        if arg == 'stop':
+            if not self.running:
+                return "Рассылка сейчас не идет"
+            self.stop()
+            return "Рассылка остановлена, продолжить: /broadcast resume"
+        if arg == 'resume':
+            if self.running:
+                return "Рассылка уже идет"
+            return "Рассылка продолжена" if self.resume(send) else "Незавершенной рассылки нет"
+        if self.running:
+            return "Рассылка уже идет. Остановить: /broadcast stop"
+        count = self.start(arg, recipients, send)
+        return f"Рассылка запущена: {count} получателей"
@@ -0,0 +1,121 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Telegram ограничивает callback_data 64 байтами
+MAX_CALLBACK_DATA = 64
+SEPARATOR = ':'
+
+
+def recipe_id(value: str) -> str:
+    """ID рецепта TheMealDB: только ASCII-цифры"""
+    # isdigit() без isascii() пропускает и другие цифры Unicode, например '²'
+    if not (value.isascii() and value.isdigit()) or len(value) > 10:
+        raise ValueError(f"некорректный id рецепта: {value!r}")
+    return value
+
+
+_RATINGS = {str(i): i for i in range(1, 6)}
+
+
+def rating(value: str) -> int:
+    """Оценка от 1 до 5"""
+    result = _RATINGS.get(value)
+    if result is None:
+        raise ValueError(f"некорректная оценка: {value!r}")
+    return result
+
+
+class _Action:
+    __slots__ = ('code', 'fields', 'handler')
+
+    def __init__(self, code, fields, handler):
+        self.code = code
+        self.fields = fields
+        self.handler = handler
+
+
+class CallbackRouter:
+    """
+    Маршрутизация нажатий на inline-кнопки по таблице префиксов.
+
+    callback_data имеет вид "код:поле1:поле2": код действия ищется в словаре за O(1),
+    поля разбираются один раз функциями-конвертерами (str, int, recipe_id, rating...),
+    а обработчик получает уже типизированные значения. Неизвестные коды и payload,
+    которые не проходят разбор (старые или поддельные кнопки), отклоняются без
+    вызова обработчиков и без обращений к API.
+    """
+
+    def __init__(self, stale_text: str = 'Кнопка устарела'):
+        """
+        Args:
+            stale_text (str): Ответ на нажатие неизвестной или устаревшей кнопки
+        """
+        self.stale_text = stale_text
+        self._actions = {}
+        self.routed = 0
+        self.rejected = 0
+
+    def action(self, code: str, *fields, aliases=()):
+        """
+        Декоратор: регистрирует обработчик handler(callback_query, *values)
+
+        Args:
+            code (str): Короткий код действия в callback_data
+            *fields: Конвертеры полей по порядку; ValueError означает некорректный payload
+            aliases: Прежние коды, которые еще могут прийти со старых кнопок
+        """
+        def decorator(handler):
+            action = _Action(code, fields, handler)
+            for key in (code, *aliases):
+                if SEPARATOR in key or key in self._actions:
+                    raise ValueError(f"Код действия {key!r} недопустим или уже занят")
+                self._actions[key] = action
+            return handler
+        return decorator
+
+    def pack(self, code: str, *values) -> str:
+        """Собирает callback_data для кнопки"""
+        action = self._actions[code]
+        if len(values) != len(action.fields):
+            raise ValueError(f"Действию {code!r} нужно полей: {len(action.fields)}")
+        data = SEPARATOR.join((code, *map(str, values)))
+        if len(data.encode('utf-8')) > MAX_CALLBACK_DATA:
+            raise ValueError(f"callback_data длиннее {MAX_CALLBACK_DATA} байт: {data!r}")
+        return data
+
+    def parse(self, data: str):
+        """
+        Разбирает callback_data
+
+        Returns:
+            tuple: (обработчик, значения) или None, если payload неизвестен или некорректен
+        """
+        if not data:
+            return None
+        parts = data.split(SEPARATOR)
+        action = self._actions.get(parts[0])
+        if action is None or len(parts) - 1 != len(action.fields):
+            return None
+        values = parts[1:]
+        try:
+            for i, convert in enumerate(action.fields):
+                values[i] = convert(values[i])
+        except ValueError:
+            return None
+        return action.handler, values
+
+    async def dispatch(self, callback_query):
+        """Вызывает обработчик нажатия или отклоняет устаревшую кнопку"""
+        parsed = self.parse(callback_query.data)
+        if parsed is None:
+            self.rejected += 1
+            logger.info(f"Отклонено нажатие с callback_data={callback_query.data!r}")
+            await callback_query.answer(self.stale_text)
+            return None
+        self.routed += 1
+        handler, values = parsed
+        return await handler(callback_query, *values)
+
+    def summary(self) -> str:
+        return f"Кнопки: {self.routed} обработано, {self.rejected} отклонено"
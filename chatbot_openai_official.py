@@ -1,9 +1,17 @@
 import os
+import time
 import logging
 from datetime import datetime
 from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from openai import OpenAI
+from telegram.ext import Application, CommandHandler, MessageHandler, TypeHandler, ApplicationHandlerStop, filters, ContextTypes
+from telegram.error import Forbidden, BadRequest
+from openai import AsyncOpenAI
+from profiling import Profiler, parse_admin_ids
+from prompt_cache import PromptBuilder, CacheStats
+from voice import VoicePipeline, transcriber_from_env, MAX_VOICE_DURATION
+from dedupe import Deduplicator
+from coalesce import MessageCoalescer
+from broadcast import Broadcaster, ChatRegistry
 
 # Попытка загрузить переменные из .env файла
 try:
@@ -31,7 +39,7 @@ if not OPENAI_API_KEY:
     raise ValueError("Не установлена переменная окружения OPENAI_API_KEY")
 
 # Инициализация OpenAI клиента с ОФИЦИАЛЬНЫМ API
-client = OpenAI(
+client = AsyncOpenAI(
     api_key=OPENAI_API_KEY,
     # Используем официальный OpenAI API endpoint
     # base_url="https://api.openai.com/v1"  # По умолчанию
@@ -56,6 +64,29 @@ SYSTEM_MESSAGE = """Ты вежливый и профессиональный л
 
 Будь полезным и дружелюбным помощником! 😊"""
 
+# Статический префикс промпта (для кэширования на стороне OpenAI) и учет попаданий в кэш
+prompt_builder = PromptBuilder(SYSTEM_MESSAGE)
+cache_stats = CacheStats()
+
+# Конвейер распознавания голосовых сообщений (бэкенд задается VOICE_BACKEND)
+voice_pipeline = VoicePipeline(transcriber_from_env(client))
+
+# Повторно доставленные обновления (ретраи вебхука, перезапуск polling)
+update_dedupe = Deduplicator(window=600)
+
+# Сообщения, отправленные подряд в течение окна (в секундах), уходят в ChatGPT одним запросом
+COALESCE_WINDOW = 1.5
+
+# Профилировщик по требованию (/profile, SIGUSR1/SIGUSR2), выключен по умолчанию
+profiler = Profiler(output_dir=os.getenv('PROFILE_DIR', 'profiles'))
+
+# Администраторы, которым доступны служебные команды
+ADMIN_IDS = parse_admin_ids(os.getenv('ADMIN_IDS', ''))
+
+# Чаты, с которыми общался бот, и рассылка по ним (/broadcast)
+chat_registry = ChatRegistry(os.getenv('CHATS_PATH', 'chats.json'))
+broadcaster = Broadcaster(os.getenv('BROADCAST_STATE', 'broadcast.json'), permanent_errors=(Forbidden, BadRequest))
+
 def log_message(direction: str, user_name: str, user_id: int, message: str, message_type: str = "text"):
     """Логирует входящие и исходящие сообщения"""
     timestamp = datetime.now().strftime("%H:%M:%S")
@@ -82,13 +113,12 @@ async def get_chatgpt_response(user_message: str) -> str:
     """
     try:
         print(f"🤖 [AI] Отправка запроса к OpenAI (GPT-5 Nano)...")
-        response = client.chat.completions.create(
+        started = time.perf_counter()
+        response = await client.chat.completions.create(
             model="gpt-5-nano",  # Используем новейшую модель GPT-5 Nano
-            messages=[
-                {"role": "system", "content": SYSTEM_MESSAGE},
-                {"role": "user", "content": user_message}
-            ]
+            messages=prompt_builder.build(user_message)
         )
+        cache_stats.record(response.usage, time.perf_counter() - started)
         
         ai_response = response.choices[0].message.content
         print(f"🤖 [AI] Получен ответ от OpenAI ({len(ai_response)} символов)")
@@ -100,6 +130,15 @@ async def get_chatgpt_response(user_message: str) -> str:
         print(f"❌ [ERROR] {error_msg}")
         return "Извините, произошла ошибка при обработке вашего запроса. Попробуйте позже."
 
+coalescer = MessageCoalescer(get_chatgpt_response, window=COALESCE_WINDOW)
+
+async def skip_duplicate_updates(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Отбрасывает обновления, которые уже обрабатывались, до всех остальных обработчиков"""
+    if update_dedupe.seen(update.update_id):
+        raise ApplicationHandlerStop
+    if update.effective_chat:
+        chat_registry.add(update.effective_chat.id)
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик команды /start"""
     user = update.effective_user
@@ -154,14 +193,47 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await context.bot.send_chat_action(chat_id=update.effective_chat.id, action="typing")
     print(f"⌨️ [TYPING] Показываем индикатор набора текста для {user.first_name}")
     
-    # Получаем ответ от ChatGPT
-    response = await get_chatgpt_response(user_message)
+    async def reply(response: str) -> None:
+        # Отправляем ответ пользователю
+        await update.message.reply_text(response)
+        
+        # Логируем исходящее сообщение
+        log_message("OUT", user.first_name, user.id, response)
     
-    # Отправляем ответ пользователю
-    await update.message.reply_text(response)
+    # Получаем ответ от ChatGPT: сообщения, отправленные подряд, объединяются в один запрос
+    coalescer.submit(update.effective_chat.id, user_message, reply)
+
+async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик голосовых сообщений: распознает речь и отвечает как на текст"""
+    user = update.effective_user
+    voice = update.message.voice
+    if voice.duration > MAX_VOICE_DURATION:
+        await update.message.reply_text(
+            f"Голосовое сообщение слишком длинное. Максимальная длительность — {MAX_VOICE_DURATION // 60} мин."
+        )
+        return
     
-    # Логируем исходящее сообщение
-    log_message("OUT", user.first_name, user.id, response)
+    await context.bot.send_chat_action(chat_id=update.effective_chat.id, action="typing")
+    
+    try:
+        user_message = await voice_pipeline.transcribe(context.bot, voice)
+    except Exception as e:
+        logger.error(f"Ошибка при распознавании голосового сообщения: {e}")
+        user_message = ""
+    if not user_message:
+        await update.message.reply_text(
+            "Не удалось распознать голосовое сообщение. Попробуйте еще раз или напишите текстом."
+        )
+        return
+    
+    log_message("IN", user.first_name, user.id, f"[VOICE] {user_message}", "voice")
+
+    async def reply(response: str) -> None:
+        await update.message.reply_text(response)
+        log_message("OUT", user.first_name, user.id, response)
+    
+    # Распознанный текст обрабатываем так же, как обычное сообщение
+    coalescer.submit(update.effective_chat.id, user_message, reply)
 
 async def handle_non_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик нетекстовых сообщений"""
@@ -171,13 +243,48 @@ async def handle_non_text(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     log_message("IN", user.first_name, user.id, f"[{message_type.upper()}]", message_type)
     
     response = (
-        "Извините, я обрабатываю только текстовые сообщения. "
-        "Пожалуйста, отправьте текстовое сообщение."
+        "Извините, я обрабатываю только текстовые и голосовые сообщения. "
+        "Пожалуйста, отправьте текстовое или голосовое сообщение."
     )
     
     await update.message.reply_text(response)
     log_message("OUT", user.first_name, user.id, response)
 
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /profile (только для администраторов)"""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    await update.message.reply_text(profiler.handle_command(' '.join(context.args)))
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /stats (только для администраторов)"""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    await update.message.reply_text(
+        f"{cache_stats.summary()}\n\n{voice_pipeline.summary()}\n\n{update_dedupe.summary('Обновления')}\n"
+        f"{coalescer.summary()}\n\n{broadcaster.summary()}"
+    )
+
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /broadcast (только для администраторов)"""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    # Текст берем из сообщения целиком, чтобы сохранить переносы строк
+    parts = update.message.text.split(maxsplit=1)
+    text = parts[1] if len(parts) > 1 else ''
+    await update.message.reply_text(broadcaster.handle_command(text, chat_registry, context.bot.send_message))
+
+async def post_init(application: Application) -> None:
+    """Устанавливает обработчики сигналов профилировщика и продолжает прерванную рассылку"""
+    profiler.install_signal_handlers()
+    application.create_task(chat_registry.run_periodic())
+    broadcaster.resume(application.bot.send_message)
+
+async def post_shutdown(application: Application) -> None:
+    """Останавливает рассылку и сохраняет список чатов"""
+    broadcaster.stop()
+    chat_registry.save()
+
 def main() -> None:
     """Основная функция запуска бота"""
     print("=" * 60)
@@ -194,12 +301,18 @@ def main() -> None:
     print("=" * 60)
     
     # Создаем приложение
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    application = Application.builder().token(TELEGRAM_TOKEN).post_init(post_init).post_shutdown(post_shutdown).build()
 
     # Добавляем обработчики
+    application.add_handler(TypeHandler(Update, skip_duplicate_updates), group=-1)
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("profile", profile_command))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("broadcast", broadcast_command))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    # Распознавание занимает секунды, поэтому не блокируем обработку других обновлений
+    application.add_handler(MessageHandler(filters.VOICE, handle_voice, block=False))
     application.add_handler(MessageHandler(~filters.TEXT, handle_non_text))
 
     # Запускаем бота
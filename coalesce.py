@@ -0,0 +1,89 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _ChatBuffer:
+    __slots__ = ('texts', 'reply', 'task', 'phase', 'generating')
+
+    def __init__(self):
+        self.texts = []
+        self.reply = None
+        self.task = None
+        # waiting — ждем окончания окна, generating — ждем ответа модели, replying — отправляем ответ
+        self.phase = None
+        self.generating = []
+
+
+class MessageCoalescer:
+    """
+    Объединяет сообщения, отправленные подряд, в один запрос к модели.
+
+    Для каждого чата сообщения копятся, пока между ними проходит меньше window секунд.
+    Если новое сообщение приходит, пока модель еще генерирует ответ на предыдущие,
+    этот запрос отменяется, а его текст объединяется с новым сообщением.
+    """
+
+    def __init__(self, generate, window: float = 1.5):
+        """
+        Args:
+            generate: Корутинная функция generate(text) -> str (запрос к модели)
+            window (float): Окно ожидания следующего сообщения в секундах
+        """
+        self.generate = generate
+        self.window = window
+        self._chats = {}
+        self.messages = 0
+        self.api_calls = 0
+        self.cancelled = 0
+
+    def submit(self, chat_id: int, text: str, reply) -> None:
+        """
+        Добавляет сообщение в буфер чата
+
+        Args:
+            chat_id (int): ID чата
+            text (str): Текст сообщения
+            reply: Корутинная функция reply(response), отправляющая ответ
+        """
+        self.messages += 1
+        state = self._chats.get(chat_id)
+        if state is None:
+            state = self._chats[chat_id] = _ChatBuffer()
+
+        if state.task is not None and not state.task.done() and state.phase != 'replying':
+            if state.phase == 'generating':
+                # Ответ на устаревший набор сообщений больше не нужен
+                self.cancelled += 1
+                state.texts = state.generating + state.texts
+                logger.info(f"Чат {chat_id}: запрос к модели отменен, пришло новое сообщение")
+            state.task.cancel()
+
+        state.texts.append(text)
+        state.reply = reply
+        state.phase = 'waiting'
+        state.task = asyncio.create_task(self._run(chat_id, state))
+
+    async def _run(self, chat_id: int, state: _ChatBuffer) -> None:
+        await asyncio.sleep(self.window)
+        state.generating, state.texts = state.texts, []
+        state.phase = 'generating'
+        self.api_calls += 1
+        response = await self.generate('\n'.join(state.generating))
+
+        state.phase = 'replying'
+        state.generating = []
+        try:
+            await state.reply(response)
+        except Exception as e:
+            logger.error(f"Чат {chat_id}: не удалось отправить ответ: {e}")
+        finally:
+            if state.task is asyncio.current_task() and not state.texts:
+                del self._chats[chat_id]
+
+    def summary(self) -> str:
+        """Сводка по объединению сообщений"""
+        saved = self.messages - self.api_calls
+        return (f"Объединение сообщений: {self.messages} сообщений, {self.api_calls} запросов к модели "
+                f"(сэкономлено {saved}), отменено {self.cancelled}")
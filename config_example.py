@@ -1,2 +1,16 @@
 BOT_TOKEN = 'your_telegram_bot_token_here'
 
+# ID администраторов, которым доступны служебные команды (/profile)
+ADMIN_IDS = []
+
+# Каталог для результатов профилирования (/profile)
+PROFILE_DIR = 'profiles'
+
+# Служебный чат для предзагрузки картинок рецептов (получение file_id заранее), None — выключено
+PREFETCH_CHAT_ID = None
+
+# Файл снимка состояния (избранное, FSM, кэши) для теплого перезапуска
+SNAPSHOT_PATH = 'bot_state.snap'
+
+# Файл состояния рассылки (/broadcast) для продолжения после перезапуска
+BROADCAST_STATE = 'bot_broadcast.json'
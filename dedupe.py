@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class Deduplicator:
+    """
+    Ограниченный по размеру и времени фильтр повторов.
+
+    Ключ считается повтором, пока он обрабатывается (in-flight) и еще window секунд
+    после завершения. Повтор, пришедший во время обработки, не выполняет работу
+    заново, а ждет результата оригинала.
+    """
+
+    def __init__(self, window: float = 600, maxsize: int = 10000):
+        self.window = window
+        self.maxsize = maxsize
+        self._done = OrderedDict()
+        self._inflight = {}
+        self.processed = 0
+        self.duplicates = 0
+
+    def _expire(self) -> None:
+        deadline = time.monotonic() - self.window
+        while self._done:
+            key, (finished_at, _) = next(iter(self._done.items()))
+            if finished_at >= deadline and len(self._done) <= self.maxsize:
+                break
+            self._done.popitem(last=False)
+
+    def __contains__(self, key) -> bool:
+        if key in self._inflight:
+            return True
+        entry = self._done.get(key)
+        return entry is not None and entry[0] >= time.monotonic() - self.window
+
+    def seen(self, key) -> bool:
+        """Отмечает ключ как обработанный; возвращает True, если он уже встречался"""
+        if key in self:
+            self.duplicates += 1
+            return True
+        self.processed += 1
+        self._done[key] = (time.monotonic(), None)
+        self._expire()
+        return False
+
+    async def run(self, key, func, *args):
+        """
+        Выполняет func(*args) один раз для ключа
+
+        Returns:
+            Результат func; для повтора — результат оригинального вызова
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            self.duplicates += 1
+            return await asyncio.shield(task)
+        entry = self._done.get(key)
+        if entry is not None and entry[0] >= time.monotonic() - self.window:
+            self.duplicates += 1
+            return entry[1]
+
+        self.processed += 1
+        task = asyncio.ensure_future(func(*args))
+        self._inflight[key] = task
+        try:
+            result = await asyncio.shield(task)
+        except BaseException:
+            # Неудачную обработку не запоминаем, чтобы повтор мог выполнить ее снова
+            if not task.done():
+                task.cancel()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        self._done[key] = (time.monotonic(), result)
+        self._expire()
+        return result
+
+    def summary(self, name: str) -> str:
+        return f"{name}: обработано {self.processed}, повторов отброшено {self.duplicates}"
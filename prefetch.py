@@ -0,0 +1,119 @@
+import asyncio
+import itertools
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """
+    Фоновая предзагрузка рецептов, которые пользователь, скорее всего, откроет следующими.
+
+    Рецепты прогреваются в порядке их места в выдаче, не более concurrency одновременно.
+    Перед запуском каждой задачи воркер уступает event loop, чтобы интерактивные
+    обработчики выполнялись первыми. Если в event loop слишком много задач
+    (бот под нагрузкой), очередь сбрасывается, а незавершенная предзагрузка отменяется.
+    """
+
+    def __init__(self, warm, top_n: int = 3, concurrency: int = 2, max_tasks: int = 100,
+                 remember: int = 1000, needed=None):
+        """
+        Args:
+            warm: Корутинная функция warm(recipe_id) -> bool, прогревающая кэши;
+                возвращает False, если рецепт уже был прогрет и работы не было
+            top_n (int): Сколько первых результатов выдачи прогревать
+            concurrency (int): Сколько рецептов прогревать одновременно
+            max_tasks (int): Порог числа задач в event loop, выше которого предзагрузка отменяется
+            remember (int): Сколько последних прогретых рецептов помнить для подсчета попаданий
+            needed: Функция needed(recipe_id) -> bool; рецепты, для которых она ложна, не ставятся в очередь
+        """
+        self.warm = warm
+        self.needed = needed
+        self.top_n = top_n
+        self.concurrency = concurrency
+        self.max_tasks = max_tasks
+        self.remember = remember
+        self._queue = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._workers = []
+        self._prefetched = OrderedDict()
+        self.scheduled = 0
+        self.warmed = 0
+        self.skipped = 0
+        self.cancelled = 0
+        self.failed = 0
+        self.accesses = 0
+        self.hits = 0
+
+    def _overloaded(self) -> bool:
+        return len(asyncio.all_tasks()) > self.max_tasks
+
+    def schedule(self, recipe_ids) -> None:
+        """Ставит в очередь первые top_n рецептов выдачи (вызывается из обработчика)"""
+        if self._overloaded():
+            self.cancelled += len(recipe_ids[:self.top_n])
+            self.cancel()
+            return
+        for rank, recipe_id in enumerate(recipe_ids[:self.top_n]):
+            if recipe_id in self._prefetched:
+                continue
+            if self.needed is not None and not self.needed(recipe_id):
+                self.skipped += 1
+                continue
+            self._queue.put_nowait((rank, next(self._seq), recipe_id))
+            self.scheduled += 1
+        while len(self._workers) < self.concurrency:
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    def cancel(self) -> None:
+        """Сбрасывает очередь и отменяет незавершенную предзагрузку"""
+        while not self._queue.empty():
+            self._queue.get_nowait()
+            self.cancelled += 1
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, recipe_id = await self._queue.get()
+            await asyncio.sleep(0)
+            if self._overloaded():
+                logger.info("Предзагрузка отменена: высокая нагрузка")
+                self.cancelled += 1
+                self.cancel()
+                return
+            try:
+                warmed = await self.warm(recipe_id)
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"Ошибка предзагрузки рецепта {recipe_id}: {e}")
+                continue
+            if not warmed:
+                # Рецепт успел попасть в кэши другим путем — попаданием это не считается
+                self.skipped += 1
+                continue
+            self.warmed += 1
+            self._prefetched[recipe_id] = True
+            while len(self._prefetched) > self.remember:
+                self._prefetched.popitem(last=False)
+
+    def record_access(self, recipe_id) -> bool:
+        """Учитывает открытие рецепта пользователем, возвращает True при попадании в предзагрузку"""
+        self.accesses += 1
+        hit = self._prefetched.pop(recipe_id, None) is not None
+        if hit:
+            self.hits += 1
+        return hit
+
+    def summary(self) -> str:
+        """Сводка для подбора top_n"""
+        hit_ratio = self.hits / self.accesses if self.accesses else 0.0
+        useful_ratio = self.hits / self.warmed if self.warmed else 0.0
+        return (
+            f"Предзагрузка (top_n={self.top_n}): прогрето {self.warmed} из {self.scheduled}, "
+            f"уже в кэше {self.skipped}, отменено {self.cancelled}, ошибок {self.failed}\n"
+            f"Попаданий: {self.hits}/{self.accesses} открытий ({hit_ratio:.0%}), "
+            f"использовано {useful_ratio:.0%} прогретых"
+        )
@@ -0,0 +1,226 @@
+import asyncio
+import cProfile
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+
+class _SlowCallbackHandler(logging.Handler):
+    """Собирает предупреждения asyncio о медленных колбэках ("Executing ... took ...")"""
+
+    def __init__(self, records: list):
+        super().__init__(level=logging.WARNING)
+        self.records = records
+
+    def emit(self, record: logging.LogRecord) -> None:
+        message = record.getMessage()
+        if message.startswith('Executing'):
+            self.records.append(f"{time.strftime('%H:%M:%S')} {message}")
+
+
+class Profiler:
+    """
+    Профилирование работающего бота по требованию.
+
+    Пока профилировщик выключен, он ничего не делает: обработчики не оборачиваются,
+    хуки не устанавливаются. После включения (командой администратора или сигналом)
+    одновременно работают:
+    - cProfile на потоке event loop (детерминированная статистика вызовов);
+    - статистический сэмплер стека этого потока (формат collapsed stacks для flamegraph);
+    - монитор задержки event loop и сбор предупреждений asyncio о медленных колбэках.
+
+    Результаты сбрасываются в файлы методом dump() без перезапуска бота.
+    """
+
+    def __init__(self, output_dir: str = 'profiles', sample_interval: float = 0.005,
+                 lag_interval: float = 0.5, slow_callback: float = 0.1):
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.lag_interval = lag_interval
+        self.slow_callback = slow_callback
+        self.enabled = False
+        self._reset()
+
+    def _reset(self) -> None:
+        self._profile = None
+        self._samples = Counter()
+        self._samples_lock = threading.Lock()
+        self._sampler = None
+        self._stop_sampling = threading.Event()
+        self._lag_task = None
+        self._lag_max = 0.0
+        self._lag_total = 0.0
+        self._lag_count = 0
+        self._slow_callbacks = []
+        self._slow_handler = None
+        self._loop_debug = False
+        self._loop_slow_duration = 0.1
+        self._started_at = 0.0
+
+    def start(self) -> None:
+        """Включает профилирование. Вызывается из потока event loop."""
+        if self.enabled:
+            return
+        loop = asyncio.get_running_loop()
+        self._reset()
+        self.enabled = True
+        self._started_at = time.monotonic()
+
+        # cProfile привязан к текущему потоку — это поток event loop
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+        # Статистический сэмплер стека потока event loop
+        self._stop_sampling.clear()
+        self._sampler = threading.Thread(
+            target=self._sample, args=(threading.get_ident(),), name='profiler-sampler', daemon=True
+        )
+        self._sampler.start()
+
+        # Предупреждения о медленных колбэках доступны только в debug-режиме loop
+        self._loop_debug = loop.get_debug()
+        self._loop_slow_duration = loop.slow_callback_duration
+        loop.slow_callback_duration = self.slow_callback
+        loop.set_debug(True)
+        self._slow_handler = _SlowCallbackHandler(self._slow_callbacks)
+        logging.getLogger('asyncio').addHandler(self._slow_handler)
+
+        self._lag_task = loop.create_task(self._watch_lag())
+        logger.info("Профилирование включено")
+
+    def stop(self) -> None:
+        """Выключает профилирование и снимает все хуки"""
+        if not self.enabled:
+            return
+        self.enabled = False
+        self._profile.disable()
+        self._stop_sampling.set()
+        self._sampler.join(timeout=1)
+        self._lag_task.cancel()
+
+        loop = asyncio.get_running_loop()
+        loop.set_debug(self._loop_debug)
+        loop.slow_callback_duration = self._loop_slow_duration
+        logging.getLogger('asyncio').removeHandler(self._slow_handler)
+        logger.info("Профилирование выключено")
+
+    def toggle(self) -> bool:
+        """Переключает профилирование, возвращает новое состояние"""
+        if self.enabled:
+            self.stop()
+        else:
+            self.start()
+        return self.enabled
+
+    def _sample(self, thread_id: int) -> None:
+        while not self._stop_sampling.wait(self.sample_interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                with self._samples_lock:
+                    self._samples[';'.join(reversed(stack))] += 1
+
+    async def _watch_lag(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.lag_interval)
+            lag = max(0.0, loop.time() - started - self.lag_interval)
+            self._lag_total += lag
+            self._lag_count += 1
+            self._lag_max = max(self._lag_max, lag)
+            if lag > self.slow_callback:
+                logger.warning(f"Задержка event loop: {lag * 1000:.0f} мс")
+
+    def summary(self) -> str:
+        """Краткая сводка для ответа администратору"""
+        if not self.enabled:
+            return "Профилирование выключено"
+        with self._samples_lock:
+            samples = sum(self._samples.values())
+        avg_lag = self._lag_total / self._lag_count if self._lag_count else 0.0
+        return (
+            f"Профилирование включено {time.monotonic() - self._started_at:.0f} с\n"
+            f"Сэмплов стека: {samples}\n"
+            f"Задержка event loop: средняя {avg_lag * 1000:.1f} мс, максимальная {self._lag_max * 1000:.1f} мс\n"
+            f"Медленных колбэков: {len(self._slow_callbacks)}"
+        )
+
+    def dump(self) -> list:
+        """
+        Сохраняет накопленные результаты, не останавливая профилирование
+
+        Returns:
+            list: Пути к созданным файлам (.pstats, .collapsed, .slow.txt)
+        """
+        if not self.enabled:
+            return []
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"profile-{time.strftime('%Y%m%d-%H%M%S')}")
+
+        # dump_stats() выключает профилировщик — включаем его обратно
+        self._profile.dump_stats(base + '.pstats')
+        self._profile.enable()
+
+        with self._samples_lock:
+            samples = list(self._samples.items())
+        with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+            for stack, count in samples:
+                f.write(f"{stack} {count}\n")
+
+        avg_lag = self._lag_total / self._lag_count if self._lag_count else 0.0
+        with open(base + '.slow.txt', 'w', encoding='utf-8') as f:
+            f.write(f"event loop lag: avg={avg_lag * 1000:.1f}ms max={self._lag_max * 1000:.1f}ms "
+                    f"checks={self._lag_count}\n")
+            for line in self._slow_callbacks:
+                f.write(line + '\n')
+
+        paths = [base + '.pstats', base + '.collapsed', base + '.slow.txt']
+        logger.info(f"Профиль сохранен: {', '.join(paths)}")
+        return paths
+
+    def handle_command(self, arg: str) -> str:
+        """
+        Выполняет команду администратора /profile
+
+        Args:
+            arg (str): on, off, dump или пустая строка для сводки
+
+        Returns:
+            str: Текст ответа
+        """
+        arg = arg.strip().lower()
+        if arg == 'on':
+            self.start()
+            return "Профилирование включено"
+        if arg == 'off':
+            paths = self.dump()
+            self.stop()
+            return "Профилирование выключено" + (f"\nФайлы: {', '.join(paths)}" if paths else "")
+        if arg == 'dump':
+            paths = self.dump()
+            return f"Файлы: {', '.join(paths)}" if paths else "Профилирование выключено, сохранять нечего"
+        return self.summary() + "\n\nИспользование: /profile on|off|dump"
+
+    def install_signal_handlers(self, loop: asyncio.AbstractEventLoop = None) -> None:
+        """SIGUSR1 переключает профилирование, SIGUSR2 сохраняет результаты (только Unix)"""
+        if not hasattr(signal, 'SIGUSR1'):
+            return
+        loop = loop or asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGUSR1, self.toggle)
+        loop.add_signal_handler(signal.SIGUSR2, self.dump)
+
+
+def parse_admin_ids(value: str) -> set:
+    """Разбирает список ID администраторов вида "123,456" """
+    return {int(item) for item in value.split(',') if item.strip()}
@@ -0,0 +1,103 @@
+import logging
+from collections.abc import Mapping
+
+logger = logging.getLogger(__name__)
+
+
+class PromptBuilder:
+    """
+    Собирает список messages так, чтобы начало запроса было побайтово одинаковым.
+
+    OpenAI автоматически кэширует общий префикс запросов (от 1024 токенов), поэтому
+    статическая часть — системное сообщение, инструкции, примеры — собирается один раз
+    и всегда идет первой, а изменяемые части (история, сообщение пользователя)
+    добавляются только после нее. Короткий префикс в кэш не попадает.
+    """
+
+    def __init__(self, system_message: str, instructions=(), examples=()):
+        """
+        Args:
+            system_message (str): Системное сообщение
+            instructions: Дополнительные системные инструкции
+            examples: Few-shot примеры — пары (сообщение пользователя, ответ ассистента)
+        """
+        prefix = [{"role": "system", "content": system_message}]
+        for text in instructions:
+            prefix.append({"role": "system", "content": text})
+        for user_text, assistant_text in examples:
+            prefix.append({"role": "user", "content": user_text})
+            prefix.append({"role": "assistant", "content": assistant_text})
+        self._prefix = tuple(prefix)
+
+    def build(self, user_message: str, history=()) -> list:
+        """
+        Возвращает messages: статический префикс, затем история и сообщение пользователя
+
+        Args:
+            user_message (str): Сообщение пользователя
+            history: Предыдущие сообщения диалога в формате messages
+
+        Returns:
+            list: Список сообщений для chat.completions.create
+        """
+        messages = list(self._prefix)
+        messages.extend(history)
+        messages.append({"role": "user", "content": user_message})
+        return messages
+
+
+class CacheStats:
+    """Учет закэшированных токенов промпта по ответам OpenAI (usage.prompt_tokens_details.cached_tokens)"""
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.hit_requests = 0
+        self.hit_latency = 0.0
+        self.miss_latency = 0.0
+
+    def record(self, usage, latency: float) -> int:
+        """
+        Учитывает один запрос
+
+        Args:
+            usage: Поле usage из ответа OpenAI (может быть None)
+            latency (float): Время запроса в секундах
+
+        Returns:
+            int: Количество закэшированных токенов в этом запросе
+        """
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        details = getattr(usage, 'prompt_tokens_details', None)
+        # openai==1.3.0 не знает этого поля и оставляет его обычным словарем
+        if isinstance(details, Mapping):
+            cached_tokens = details.get('cached_tokens') or 0
+        else:
+            cached_tokens = getattr(details, 'cached_tokens', 0) or 0
+
+        self.requests += 1
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        if cached_tokens:
+            self.hit_requests += 1
+            self.hit_latency += latency
+        else:
+            self.miss_latency += latency
+
+        logger.info(f"Промпт: {prompt_tokens} токенов, из кэша {cached_tokens}, {latency * 1000:.0f} мс")
+        return cached_tokens
+
+    def summary(self) -> str:
+        """Сводка по кэшу промптов"""
+        if not self.requests:
+            return "Кэш промптов: запросов еще не было"
+        misses = self.requests - self.hit_requests
+        token_ratio = self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+        hit_avg = self.hit_latency / self.hit_requests if self.hit_requests else 0.0
+        miss_avg = self.miss_latency / misses if misses else 0.0
+        return (
+            f"Кэш промптов: {self.hit_requests}/{self.requests} запросов с попаданием, "
+            f"{self.cached_tokens}/{self.prompt_tokens} токенов ({token_ratio:.0%})\n"
+            f"Средняя задержка: с кэшем {hit_avg * 1000:.0f} мс, без кэша {miss_avg * 1000:.0f} мс"
+        )
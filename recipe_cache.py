@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import pickle
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """Простой LRU-кэш с ограничением по размеру и времени жизни записей"""
+
+    def __init__(self, maxsize: int = 512, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Записи снимка, еще не поднятые в память (см. snapshot.py)
+        self._snapshot = None
+        self._section = None
+        self._cold = set()
+
+    def _hydrate(self, key) -> None:
+        if key in self._cold:
+            self._cold.discard(key)
+            expires_at, value = self._snapshot.load(self._section, key)
+            remaining = expires_at - time.time()
+            if remaining > 0 and key not in self._data:
+                self._data[key] = (time.monotonic() + remaining, value)
+
+    def get(self, key, default=None):
+        self._hydrate(key)
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key, value) -> None:
+        self._cold.discard(key)
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __contains__(self, key) -> bool:
+        self._hydrate(key)
+        item = self._data.get(key)
+        return item is not None and item[0] >= time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._data) + len(self._cold)
+
+    def attach(self, snapshot, section: str) -> None:
+        """Подключает снимок: записи поднимаются при первом обращении"""
+        self._snapshot = snapshot
+        self._section = section
+        self._cold = set(snapshot.keys(section)) - set(self._data)
+
+    def rebind(self, snapshot) -> None:
+        self._snapshot = snapshot
+
+    def snapshot_items(self):
+        """Пары (ключ, сериализованное значение) для снимка; срок жизни пересчитывается в абсолютное время"""
+        now, wall = time.monotonic(), time.time()
+        items = [(key, pickle.dumps((wall + expires - now, value), protocol=pickle.HIGHEST_PROTOCOL))
+                 for key, (expires, value) in self._data.items() if expires >= now]
+        items.extend((key, self._snapshot.get_raw(self._section, key)) for key in self._cold)
+        return items
+
+
+class RecipeIndex:
+    """Локальный индекс уже встречавшихся рецептов (Meal) для поиска по названию без запроса к TheMealDB"""
+
+    def __init__(self, maxsize: int = 5000):
+        self.maxsize = maxsize
+        self._recipes = OrderedDict()
+        self._snapshot = None
+        self._section = None
+
+    def _hydrate(self) -> None:
+        # Поиск идет по всем названиям, поэтому индекс поднимается из снимка целиком
+        if self._snapshot is not None:
+            restored = self._snapshot.load(self._section, 'recipes')
+            self._snapshot = None
+            restored.update(self._recipes)
+            self._recipes = restored
+
+    def attach(self, snapshot, section: str) -> None:
+        if 'recipes' in snapshot.keys(section):
+            self._snapshot = snapshot
+            self._section = section
+
+    def rebind(self, snapshot) -> None:
+        if self._snapshot is not None:
+            self._snapshot = snapshot
+
+    def snapshot_items(self):
+        self._hydrate()
+        return [('recipes', pickle.dumps(self._recipes, protocol=pickle.HIGHEST_PROTOCOL))]
+
+    def add(self, recipes) -> None:
+        self._hydrate()
+        for recipe in recipes:
+            self._recipes[recipe.id] = recipe
+            self._recipes.move_to_end(recipe.id)
+        while len(self._recipes) > self.maxsize:
+            self._recipes.popitem(last=False)
+
+    def search(self, query: str, limit: int = 20) -> list:
+        """Рецепты, в названии которых встречается query (сначала совпадения с начала названия)"""
+        self._hydrate()
+        query = query.lower()
+        prefix, other = [], []
+        for recipe in self._recipes.values():
+            title = recipe.title.lower()
+            if title.startswith(query):
+                prefix.append(recipe)
+            elif query in title:
+                other.append(recipe)
+        return (prefix + other)[:limit]
+
+
+class DebouncedLookup:
+    """
+    Удаленный поиск для inline-запросов, которые приходят на каждое нажатие клавиши.
+
+    Запрос к API выполняется, только если за время delay от того же пользователя
+    не пришел более новый запрос. Одинаковые запросы разных пользователей делят
+    одно обращение к API, а таймаут ожидания не отменяет само обращение —
+    его результат попадет в кэш и пригодится следующему запросу.
+    """
+
+    def __init__(self, fetch, delay: float = 0.3):
+        """
+        Args:
+            fetch: Корутинная функция fetch(query) -> list | None (None — ошибка API)
+            delay (float): Пауза в секундах перед обращением к API
+        """
+        self.fetch = fetch
+        self.delay = delay
+        self._latest = {}
+        self._inflight = {}
+
+    async def lookup(self, user_id: int, query: str, timeout: float):
+        """
+        Returns:
+            list | None: Результаты или None, если запрос устарел, не уложился в timeout или API вернул ошибку
+        """
+        token = object()
+        self._latest[user_id] = token
+        await asyncio.sleep(self.delay)
+        if self._latest.get(user_id) is not token:
+            return None
+        del self._latest[user_id]
+
+        task = self._inflight.get(query)
+        if task is None:
+            task = asyncio.create_task(self.fetch(query))
+            self._inflight[query] = task
+            task.add_done_callback(lambda t: self._forget(query, t))
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Поиск '{query}' не уложился в {timeout} с")
+            return None
+        except Exception as e:
+            logger.error(f"Ошибка поиска '{query}': {e}")
+            return None
+
+    def _forget(self, query: str, task: asyncio.Task) -> None:
+        self._inflight.pop(query, None)
+        # Забираем исключение, даже если результата уже никто не ждет
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,302 @@
+import asyncio
+import logging
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'TGSNAP1\n'
+_TRAILER = struct.Struct('<Q')
+
+
+class SnapshotFile:
+    """
+    Файл снимка, открытый через mmap.
+
+    Формат: MAGIC, затем записи (каждая — отдельно сериализованное pickle-значение),
+    затем индекс {секция: {ключ: (смещение, длина)}} и 8 байт со смещением индекса.
+    При открытии читается только индекс, сами записи десериализуются по запросу.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        self.size = len(self._mm)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path}: не файл снимка")
+        (index_offset,) = _TRAILER.unpack(self._mm[-_TRAILER.size:])
+        self._index = pickle.loads(self._mm[index_offset:-_TRAILER.size])
+
+    @classmethod
+    def open(cls, path: str):
+        """Открывает снимок; возвращает None, если файла нет или он поврежден"""
+        if not os.path.exists(path):
+            return None
+        try:
+            return cls(path)
+        except Exception as e:
+            logger.warning(f"Не удалось открыть снимок {path}: {e}")
+            return None
+
+    def keys(self, section: str):
+        return self._index.get(section, {}).keys()
+
+    def get_raw(self, section: str, key) -> bytes:
+        offset, length = self._index[section][key]
+        return self._mm[offset:offset + length]
+
+    def load(self, section: str, key):
+        return pickle.loads(self.get_raw(section, key))
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+
+def write_snapshot(path: str, sections: dict) -> tuple:
+    """
+    Записывает снимок во временный файл с уникальным именем рядом с path
+
+    Args:
+        path (str): Итоговый путь снимка
+        sections (dict): {секция: [(ключ, сериализованное значение), ...]}
+
+    Returns:
+        tuple: (путь временного файла, размер в байтах)
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=name + '.', suffix='.tmp')
+    index = {}
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            offset = len(MAGIC)
+            for section, items in sections.items():
+                section_index = index[section] = {}
+                for key, raw in items:
+                    f.write(raw)
+                    section_index[key] = (offset, len(raw))
+                    offset += len(raw)
+            f.write(pickle.dumps(index, protocol=pickle.HIGHEST_PROTOCOL))
+            f.write(_TRAILER.pack(offset))
+            f.flush()
+            os.fsync(f.fileno())
+            return tmp_path, f.tell()
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def dumps(value) -> bytes:
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+class LazyDict(dict):
+    """
+    dict, который догружает записи из снимка при первом обращении.
+
+    Ключи, еще не прочитанные из снимка, хранятся в _cold; обычные операции
+    (get, in, [], присваивание, удаление) видят их как присутствующие.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._snapshot = None
+        self._section = None
+        self._cold = set()
+
+    def attach(self, snapshot: SnapshotFile, section: str) -> None:
+        """Подключает снимок после запуска: все его ключи становятся холодными"""
+        self._snapshot = snapshot
+        self._section = section
+        self._cold = set(snapshot.keys(section)) - set(dict.keys(self))
+
+    def rebind(self, snapshot: SnapshotFile) -> None:
+        """Переключает холодные ключи на только что записанный снимок"""
+        self._snapshot = snapshot
+
+    def _hydrate(self, key) -> None:
+        if key in self._cold:
+            self._cold.discard(key)
+            dict.__setitem__(self, key, self._snapshot.load(self._section, key))
+
+    def __missing__(self, key):
+        if key in self._cold:
+            self._hydrate(key)
+            return dict.__getitem__(self, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        self._hydrate(key)
+        return dict.get(self, key, default)
+
+    def __contains__(self, key) -> bool:
+        return dict.__contains__(self, key) or key in self._cold
+
+    def __setitem__(self, key, value) -> None:
+        self._cold.discard(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key) -> None:
+        if key in self._cold:
+            self._cold.discard(key)
+            return
+        dict.__delitem__(self, key)
+
+    def pop(self, key, *default):
+        self._hydrate(key)
+        return dict.pop(self, key, *default)
+
+    def setdefault(self, key, default=None):
+        self._hydrate(key)
+        return dict.setdefault(self, key, default)
+
+    def __len__(self) -> int:
+        return dict.__len__(self) + len(self._cold)
+
+    def __iter__(self):
+        yield from dict.keys(self)
+        yield from list(self._cold)
+
+    def keys(self):
+        return list(self)
+
+    def items(self):
+        for key in list(self._cold):
+            self._hydrate(key)
+        return dict.items(self)
+
+    def values(self):
+        for key in list(self._cold):
+            self._hydrate(key)
+        return dict.values(self)
+
+    def snapshot_items(self):
+        """Пары (ключ, сериализованное значение); холодные записи копируются без десериализации"""
+        items = [(key, dumps(value)) for key, value in dict.items(self)]
+        items.extend((key, self._snapshot.get_raw(self._section, key)) for key in self._cold)
+        return items
+
+
+class MemoryStorageSnapshot:
+    """Снимок состояний FSM из aiogram MemoryStorage (записей мало, восстанавливаются сразу)"""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def attach(self, snapshot: SnapshotFile, section: str) -> None:
+        for key in snapshot.keys(section):
+            try:
+                state, data = snapshot.load(section, key)
+            except Exception as e:
+                # Например, после обновления aiogram, изменившего формат записей
+                logger.warning(f"Состояние FSM {key!r} из снимка пропущено: {e}")
+                continue
+            record = self.storage.storage[key]
+            record.state = state
+            record.data = data
+
+    def rebind(self, snapshot: SnapshotFile) -> None:
+        pass
+
+    def snapshot_items(self):
+        return [(key, dumps((record.state, record.data)))
+                for key, record in self.storage.storage.items()
+                if record.state is not None or record.data]
+
+
+class Snapshotter:
+    """
+    Периодические и финальные снимки состояния в памяти для теплого перезапуска.
+
+    Значения сериализуются в потоке event loop (чтобы снимок был согласованным),
+    запись файла и fsync выполняются в отдельном потоке, затем файл атомарно
+    заменяется через os.replace. Сохранения выполняются строго по одному. При запуске снимок только открывается через mmap,
+    а записи поднимаются из него при первом обращении.
+    """
+
+    def __init__(self, path: str, interval: float = 300):
+        self.path = path
+        self.interval = interval
+        self._containers = {}
+        self._snapshot = None
+        self._lock = asyncio.Lock()
+        self.last_size = 0
+        self.last_write_time = 0.0
+        self.restore_time = 0.0
+        self.restored_size = 0
+
+    def register(self, section: str, container) -> None:
+        """Регистрирует контейнер с методами attach, rebind и snapshot_items"""
+        self._containers[section] = container
+
+    def restore(self) -> None:
+        """Подключает снимок, оставшийся с прошлого запуска"""
+        started = time.perf_counter()
+        self._snapshot = SnapshotFile.open(self.path)
+        if self._snapshot is None:
+            return
+        for section, container in self._containers.items():
+            try:
+                container.attach(self._snapshot, section)
+            except Exception as e:
+                logger.warning(f"Секция {section!r} снимка {self.path} пропущена: {e}")
+        self.restore_time = time.perf_counter() - started
+        self.restored_size = self._snapshot.size
+        logger.info(f"Снимок {self.path} подключен: {self.restored_size} байт за {self.restore_time * 1000:.1f} мс")
+
+    async def save(self) -> None:
+        """Сохраняет снимок текущего состояния; одновременные вызовы выполняются по очереди"""
+        async with self._lock:
+            await self._save()
+
+    async def _save(self) -> None:
+        started = time.perf_counter()
+        sections = {section: container.snapshot_items() for section, container in self._containers.items()}
+        tmp_path, size = await asyncio.to_thread(write_snapshot, self.path, sections)
+
+        # Старый файл закрываем до замены: на Windows открытый через mmap файл заменить нельзя
+        if self._snapshot is not None:
+            self._snapshot.close()
+        try:
+            os.replace(tmp_path, self.path)
+        except OSError:
+            os.unlink(tmp_path)
+            raise
+        finally:
+            # После неудачной замены снова открываем прежний файл
+            self._snapshot = SnapshotFile.open(self.path)
+            if self._snapshot is not None:
+                for container in self._containers.values():
+                    container.rebind(self._snapshot)
+
+        self.last_size = size
+        self.last_write_time = time.perf_counter() - started
+        logger.info(f"Снимок {self.path} сохранен: {size} байт за {self.last_write_time * 1000:.1f} мс")
+
+    async def run_periodic(self) -> None:
+        """Сохраняет снимок каждые interval секунд"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                # При отмене задачи начатое сохранение завершается, а lock держится до его конца
+                await asyncio.shield(self.save())
+            except Exception as e:
+                logger.error(f"Ошибка сохранения снимка: {e}")
+
+    def summary(self) -> str:
+        """Сводка по снимкам"""
+        return (
+            f"Снимок: восстановлен {self.restored_size} байт за {self.restore_time * 1000:.1f} мс, "
+            f"последняя запись {self.last_size} байт за {self.last_write_time * 1000:.1f} мс"
+        )
@@ -1,5 +1,13 @@
 import os
-from openai import OpenAI
+import sys
+import math
+import json
+import time
+import asyncio
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from openai import OpenAI, AsyncOpenAI
 
 # Попытка загрузить переменные из .env файла
 try:
@@ -8,6 +16,19 @@ try:
 except ImportError:
     print("Для загрузки .env файла установите python-dotenv: pip install python-dotenv")
 
+# Известные эндпоинты; local — встроенная заглушка, если не указан --local-url
+ENDPOINTS = {
+    'official': 'https://api.openai.com/v1',
+    'proxyapi': 'https://api.proxyapi.ru/openai/v1',
+    'local': None,
+}
+MODELS = ['gpt-4o', 'gpt-5-nano']
+BENCH_PROMPT = "Расскажи в трех предложениях, как приготовить омлет."
+# У моделей с рассуждениями скрытые reasoning-токены тоже расходуют max_completion_tokens,
+# поэтому им добавляется запас сверх --max-tokens и выбирается минимальный уровень рассуждений
+REASONING_MODELS = ('gpt-5', 'o1', 'o3', 'o4')
+REASONING_HEADROOM = 1024
+
 def test_openai_connection():
     """Тестирует подключение к OpenAI API"""
     
@@ -44,5 +65,243 @@ def test_openai_connection():
         print(f"❌ Ошибка подключения к OpenAI: {e}")
         return False
 
+class LocalStandInHandler(BaseHTTPRequestHandler):
+    """Локальная заглушка /v1/chat/completions: отдает поток из фиксированного числа токенов"""
+
+    tokens = 50
+    first_token_delay = 0.05
+    token_delay = 0.005
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        model = body.get('model', 'local')
+        include_usage = (body.get('stream_options') or {}).get('include_usage')
+        time.sleep(self.first_token_delay)
+
+        if not body.get('stream'):
+            payload = json.dumps({
+                "id": "local", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok " * self.tokens},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": self.tokens, "total_tokens": 10 + self.tokens}
+            }).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        for i in range(self.tokens):
+            last = i == self.tokens - 1
+            chunk = {
+                "id": "local", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": {"content": "ok "}, "finish_reason": "stop" if last else None}]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+            time.sleep(self.token_delay)
+        if include_usage:
+            chunk = {
+                "id": "local", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [],
+                "usage": {"prompt_tokens": 10, "completion_tokens": self.tokens, "total_tokens": 10 + self.tokens}
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+def start_local_stand_in() -> str:
+    """Запускает заглушку в фоновом потоке и возвращает ее base_url"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), LocalStandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+def percentile(values: list, p: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(values)))
+    return values[rank - 1]
+
+def field(obj, name: str):
+    """Поле ответа API: openai==1.3.0 оставляет незнакомые ему поля (usage в потоке) словарями"""
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+async def measure_request(client: AsyncOpenAI, model: str, max_tokens: int) -> dict:
+    """
+    Выполняет один потоковый запрос и замеряет время до первого токена и общее время.
+
+    status: ok — получен ответ, truncated — ответ обрезан лимитом (finish_reason == 'length'),
+    empty — видимого текста нет (например, весь лимит ушел на рассуждения), error — ошибка запроса.
+    """
+    # stream_options и reasoning_effort появились в SDK позже 1.3.0, поэтому передаются через extra_body
+    extra_body = {"stream_options": {"include_usage": True}}
+    if model.startswith(REASONING_MODELS):
+        # Модели gpt-5 и o-серии принимают только max_completion_tokens
+        extra_body["max_completion_tokens"] = max_tokens + REASONING_HEADROOM
+        extra_body["reasoning_effort"] = 'minimal' if model.startswith('gpt-5') else 'low'
+        limits = {}
+    else:
+        limits = {"max_tokens": max_tokens}
+    started = time.perf_counter()
+    ttft = None
+    chunks = 0
+    finish_reason = None
+    usage = None
+    try:
+        stream = await client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": BENCH_PROMPT}],
+            stream=True,
+            extra_body=extra_body,
+            **limits
+        )
+        async for chunk in stream:
+            usage = field(chunk, 'usage') or usage
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            finish_reason = choice.finish_reason or finish_reason
+            if choice.delta.content:
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+                chunks += 1
+    except Exception as e:
+        return {"status": "error", "error": f"{type(e).__name__}: {e}", "latency": time.perf_counter() - started}
+    latency = time.perf_counter() - started
+
+    # Видимые токены — из usage (без reasoning-токенов); если сервер usage не прислал, считаем фрагменты потока
+    completion_tokens = field(usage, 'completion_tokens')
+    if completion_tokens is not None:
+        reasoning_tokens = field(field(usage, 'completion_tokens_details'), 'reasoning_tokens') or 0
+        tokens = completion_tokens - reasoning_tokens
+        token_source = 'usage'
+    else:
+        tokens = chunks
+        token_source = 'chunks'
+
+    if ttft is None:
+        status = "empty"
+    elif finish_reason == 'length':
+        status = "truncated"
+    else:
+        status = "ok"
+    return {"status": status, "ttft": ttft, "latency": latency, "tokens": tokens,
+            "token_source": token_source, "finish_reason": finish_reason}
+
+async def run_benchmark(endpoint: str, base_url: str, api_key: str, model: str,
+                        requests: int, concurrency: int, max_tokens: int, timeout: float) -> dict:
+    """Отправляет requests запросов, не более concurrency одновременно, и собирает статистику"""
+    client = AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited():
+        async with semaphore:
+            return await measure_request(client, model, max_tokens)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(limited() for _ in range(requests)))
+    wall_time = time.perf_counter() - started
+
+    # В задержки и скорость попадают только полные ответы: обрезанные и пустые короче
+    # настоящих и исказили бы перцентили, поэтому они считаются отдельно
+    ok = [r for r in results if r["status"] == "ok"]
+    latencies = [r["latency"] for r in ok]
+    ttfts = [r["ttft"] for r in ok]
+    rates = [r["tokens"] / (r["latency"] - r["ttft"]) for r in ok if r["latency"] > r["ttft"]]
+    errors = {}
+    for r in results:
+        if r["status"] == "error":
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    failed = sum(errors.values())
+
+    return {
+        "endpoint": endpoint,
+        "base_url": base_url,
+        "model": model,
+        "requests": requests,
+        "concurrency": concurrency,
+        "ok": len(ok),
+        "truncated": sum(r["status"] == "truncated" for r in results),
+        "empty": sum(r["status"] == "empty" for r in results),
+        "errors": failed,
+        "error_rate": failed / len(results),
+        "error_kinds": errors,
+        "token_source": sorted({r["token_source"] for r in ok}),
+        "ttft_p50": percentile(ttfts, 50),
+        "ttft_p95": percentile(ttfts, 95),
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+        "tokens_per_second_p50": percentile(rates, 50),
+        "throughput_rps": len(ok) / wall_time if wall_time else None,
+        "wall_time": wall_time,
+    }
+
+async def run_all(args) -> list:
+    results = []
+    for endpoint in args.endpoints:
+        if endpoint == 'local':
+            base_url = args.local_url or start_local_stand_in()
+            api_key = 'local'
+        else:
+            base_url = ENDPOINTS[endpoint]
+            api_key = os.getenv('OPENAI_API_KEY')
+            if not api_key:
+                print(f"❌ {endpoint}: не установлена переменная окружения OPENAI_API_KEY", file=sys.stderr)
+                continue
+        for model in args.models:
+            print(f"🔄 {endpoint} / {model}: {args.requests} запросов, параллельно {args.concurrency}...", file=sys.stderr)
+            result = await run_benchmark(endpoint, base_url, api_key, model, args.requests,
+                                         args.concurrency, args.max_tokens, args.timeout)
+            results.append(result)
+            p50 = result["latency_p50"]
+            counts = (f"обрезано {result['truncated']}, пустых {result['empty']}, "
+                      f"ошибок {result['error_rate']:.0%} {list(result['error_kinds'])[:1]}")
+            print(f"   p50 {p50 * 1000:.0f} мс, {counts}" if p50 is not None
+                  else f"   ни одного полного ответа: {counts}", file=sys.stderr)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Проверка подключения к OpenAI (без аргументов) и замер задержек и пропускной способности эндпоинтов (--bench)"
+    )
+    parser.add_argument('--bench', action='store_true', help="Запустить замер вместо проверки подключения")
+    parser.add_argument('--endpoints', nargs='+', choices=list(ENDPOINTS), default=['local'],
+                        help="Эндпоинты для замера (по умолчанию local)")
+    parser.add_argument('--models', nargs='+', default=MODELS, help="Модели для замера")
+    parser.add_argument('--requests', type=int, default=20, help="Запросов на каждую пару эндпоинт/модель")
+    parser.add_argument('--concurrency', type=int, default=4, help="Одновременных запросов")
+    parser.add_argument('--max-tokens', type=int, default=100, help="Ограничение длины ответа")
+    parser.add_argument('--timeout', type=float, default=60, help="Таймаут одного запроса в секундах")
+    parser.add_argument('--local-url', help="base_url своего локального сервера вместо встроенной заглушки")
+    parser.add_argument('--output', help="Файл для результатов в JSON (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    if not args.bench:
+        return 0 if test_openai_connection() else 1
+
+    results = asyncio.run(run_all(args))
+    report = json.dumps({"timestamp": time.time(), "results": results}, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report)
+        print(f"✅ Результаты сохранены в {args.output}", file=sys.stderr)
+    else:
+        print(report)
+    return 0
+
 if __name__ == "__main__":
-    test_openai_connection()
+    sys.exit(main())
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длительность голосового сообщения в секундах
+MAX_VOICE_DURATION = 300
+
+
+async def decode_to_wav(source: str, target: str, sample_rate: int = 16000, timeout: float = 120) -> None:
+    """
+    Декодирует голосовое сообщение (OGG/Opus) в WAV моно с нужной частотой дискретизации.
+    ffmpeg запускается как асинхронный подпроцесс и не блокирует event loop.
+    """
+    process = await asyncio.create_subprocess_exec(
+        'ffmpeg', '-nostdin', '-loglevel', 'error', '-y', '-i', source,
+        '-ac', '1', '-ar', str(sample_rate), target,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        _, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except BaseException:
+        process.kill()
+        await process.wait()
+        raise
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg завершился с кодом {process.returncode}: {stderr.decode(errors='replace').strip()}")
+
+
+class OpenAITranscriber:
+    """Распознавание речи через OpenAI (whisper-1), client — AsyncOpenAI"""
+
+    # whisper-1 принимает OGG/Opus напрямую, а WAV 16 кГц был бы в 10-16 раз больше
+    needs_wav = False
+
+    def __init__(self, client, model: str = 'whisper-1'):
+        self.client = client
+        self.model = model
+
+    async def transcribe(self, path: str) -> str:
+        with open(path, 'rb') as audio:
+            transcription = await self.client.audio.transcriptions.create(model=self.model, file=audio)
+        return transcription.text
+
+
+class StaticTranscriber:
+    """Локальная заглушка для тестов: всегда возвращает заданный текст"""
+
+    needs_wav = False
+
+    def __init__(self, text: str = 'Привет! Это тестовое голосовое сообщение.'):
+        self.text = text
+
+    async def transcribe(self, path: str) -> str:
+        return self.text
+
+
+def transcriber_from_env(client):
+    """Выбирает бэкенд распознавания по переменной окружения VOICE_BACKEND (openai или static)"""
+    backend = os.getenv('VOICE_BACKEND', 'openai')
+    if backend == 'static':
+        return StaticTranscriber(os.getenv('VOICE_STATIC_TEXT', StaticTranscriber().text))
+    return OpenAITranscriber(client)
+
+
+class StageStats:
+    """Счетчики одной стадии конвейера"""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.in_flight = 0
+        self.count = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def summary(self) -> str:
+        avg = self.total_time / self.count if self.count else 0.0
+        return (f"{self.name}: {self.count} (ошибок {self.errors}), сейчас {self.in_flight}/{self.limit}, "
+                f"среднее {avg * 1000:.0f} мс, максимум {self.max_time * 1000:.0f} мс")
+
+
+class VoicePipeline:
+    """
+    Конвейер обработки голосовых сообщений: скачивание -> декодирование -> распознавание.
+
+    Файл скачивается потоком прямо на диск и передается бэкенду как есть; в WAV через
+    ffmpeg он перекодируется, только если бэкенду нужен PCM (needs_wav). Число
+    одновременных задач на каждой стадии ограничено, время каждой стадии учитывается.
+    """
+
+    def __init__(self, transcriber, download_limit: int = 4, decode_limit: int = 2,
+                 transcribe_limit: int = 4, chunk_size: int = 64 * 1024):
+        self.transcriber = transcriber
+        self.chunk_size = chunk_size
+        self._decode_needed = getattr(transcriber, 'needs_wav', False)
+        if self._decode_needed and shutil.which('ffmpeg') is None:
+            logger.warning("ffmpeg не найден: голосовые сообщения будут распознаваться без перекодирования")
+            self._decode_needed = False
+        self._limits = {
+            'download': asyncio.Semaphore(download_limit),
+            'decode': asyncio.Semaphore(decode_limit),
+            'transcribe': asyncio.Semaphore(transcribe_limit),
+        }
+        self.stats = {
+            'download': StageStats('Скачивание', download_limit),
+            'decode': StageStats('Декодирование', decode_limit),
+            'transcribe': StageStats('Распознавание', transcribe_limit),
+        }
+
+    async def _run_stage(self, stage: str, coro):
+        stats = self.stats[stage]
+        async with self._limits[stage]:
+            stats.in_flight += 1
+            started = time.perf_counter()
+            try:
+                return await coro
+            except Exception:
+                stats.errors += 1
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                stats.in_flight -= 1
+                stats.count += 1
+                stats.total_time += elapsed
+                stats.max_time = max(stats.max_time, elapsed)
+
+    async def _download(self, bot, file_id: str, target: str) -> None:
+        tg_file = await bot.get_file(file_id)
+        async with httpx.AsyncClient(timeout=30) as http:
+            async with http.stream('GET', tg_file.file_path) as resp:
+                resp.raise_for_status()
+                with open(target, 'wb') as f:
+                    async for chunk in resp.aiter_bytes(self.chunk_size):
+                        f.write(chunk)
+
+    async def transcribe(self, bot, voice) -> str:
+        """
+        Распознает голосовое сообщение
+
+        Args:
+            bot: Экземпляр telegram.Bot
+            voice: Объект telegram.Voice из сообщения
+
+        Returns:
+            str: Распознанный текст
+        """
+        with tempfile.TemporaryDirectory(prefix='voice-') as tmp:
+            source = os.path.join(tmp, 'voice.ogg')
+            await self._run_stage('download', self._download(bot, voice.file_id, source))
+            audio = source
+            if self._decode_needed:
+                audio = os.path.join(tmp, 'voice.wav')
+                await self._run_stage('decode', decode_to_wav(source, audio))
+            text = await self._run_stage('transcribe', self.transcriber.transcribe(audio))
+        return text.strip()
+
+    def summary(self) -> str:
+        """Сводка по стадиям конвейера"""
+        return "Голосовые сообщения:\n" + "\n".join(stats.summary() for stats in self.stats.values())